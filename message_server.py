@@ -1,53 +1,338 @@
-from typing import Dict
+from collections import OrderedDict, defaultdict, deque
+from typing import Deque, Dict, Iterator, Set, Tuple
+import array
 import os
-import json
+import orjson
 import logging
+import queue
+import sqlite3
+import sys
+import threading
+import time
 from datetime import datetime
 
+try:
+    from eventlet import patcher, tpool
+except ImportError:
+    patcher = tpool = None
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MAX_CACHED_ROOMS = 1000
+HISTORY_SIZE = 200
+WRITE_BATCH_SIZE = 64
+LEGACY_FILES = ("messages.json", "messages.jsonl")
+
+TIMESTAMP_CACHE_NS = 100_000_000
+
+_dict_pool: Deque[Dict] = deque(maxlen=1024)
+_iso_ts_cache = (-TIMESTAMP_CACHE_NS, "")
+
+
+def cached_iso_timestamp() -> str:
+    """Get the current time in ISO format, reused for up to 100ms."""
+    global _iso_ts_cache
+    now_ns = time.monotonic_ns()
+    last_ns, iso_ts = _iso_ts_cache
+    if now_ns - last_ns < TIMESTAMP_CACHE_NS:
+        return iso_ts
+    iso_ts = datetime.now().isoformat()
+    _iso_ts_cache = (now_ns, iso_ts)
+    return iso_ts
+
+
+def _run_blocking(func, *args):
+    """Run blocking work in a native thread when eventlet has patched threading."""
+    if tpool is not None and patcher.is_monkey_patched("thread"):
+        return tpool.execute(func, *args)
+    return func(*args)
+
+
+def acquire_message_dict() -> Dict:
+    """Take an empty message dict from the pool, or create one."""
+    md = _dict_pool.pop() if _dict_pool else {}
+    md.clear()
+    return md
+
+
+def release_message_dict(md: Dict):
+    """Return a message dict to the pool once it has been emitted."""
+    _dict_pool.append(md)
+
+
+def _build_message(name: str, message: str, timestamp: str, message_id: int) -> Dict:
+    return {
+        "name": name,
+        "message": message,
+        "timestamp": timestamp,
+        "id": message_id,
+    }
+
+
+def _as_text(value) -> str:
+    """Coerce a scalar message field to str, rejecting nested values."""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise TypeError(f"Unsupported message field type: {type(value).__name__}")
+
+
+def _legacy_row(room: str, record: Dict) -> Tuple:
+    """Build a database row from a legacy message record, validating its fields."""
+    message_id = record["id"]
+    if not isinstance(message_id, int) or isinstance(message_id, bool):
+        raise TypeError(f"Invalid message id: {message_id!r}")
+    timestamp = record["timestamp"]
+    datetime.fromisoformat(timestamp)
+    return (
+        _as_text(room),
+        message_id,
+        _as_text(record["name"]),
+        _as_text(record["message"]),
+        timestamp,
+    )
+
+
+class RoomStore:
+    """Recent history of a room, stored column-wise instead of as a list of dicts."""
+
+    __slots__ = ("maxlen", "names", "bodies", "ts", "ids")
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self.names: list = []
+        self.bodies: list = []
+        self.ts: list = []
+        self.ids = array.array("q")
+
+    def append(self, name: str, message: str, timestamp: str, message_id: int):
+        """Append a message, trimming the columns once they reach twice maxlen."""
+        self.names.append(sys.intern(name))
+        self.bodies.append(message)
+        self.ts.append(timestamp)
+        self.ids.append(message_id)
+        if len(self.ids) >= 2 * self.maxlen:
+            excess = len(self.ids) - self.maxlen
+            del self.names[:excess]
+            del self.bodies[:excess]
+            del self.ts[:excess]
+            del self.ids[:excess]
+
+    def to_messages(self) -> list:
+        """Rebuild the last maxlen messages as message dicts."""
+        start = max(len(self.ids) - self.maxlen, 0)
+        return list(
+            map(
+                _build_message,
+                self.names[start:],
+                self.bodies[start:],
+                self.ts[start:],
+                self.ids[start:],
+            )
+        )
+
 
 class MessageServer:
-    def __init__(self, message_file: str = "messages.json"):
-        self.message_file = message_file
-        self.messages: Dict = self._load_all_messages()
+    def __init__(
+        self,
+        db_file: str = "messages.db",
+        max_cached_rooms: int = MAX_CACHED_ROOMS,
+        history_size: int = HISTORY_SIZE,
+        legacy_files: Tuple[str, ...] = LEGACY_FILES,
+    ):
+        self.db_file = db_file
+        self.max_cached_rooms = max_cached_rooms
+        self.history_size = history_size
+        self.messages: "OrderedDict[str, RoomStore]" = OrderedDict()
+        self._conn = self._connect()
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                room TEXT NOT NULL,
+                id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                message TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                PRIMARY KEY (room, id)
+            )
+            """
+        )
+        self._import_legacy_logs(legacy_files)
+        self._next_id: Dict[str, int] = defaultdict(int)
+        self._next_id.update(
+            self._conn.execute(
+                "SELECT room, MAX(id) + 1 FROM messages GROUP BY room"
+            ).fetchall()
+        )
+        self._nonempty_rooms: Set[str] = set(self._next_id)
+        self._write_conn = self._connect()
+        self._write_q: queue.Queue = queue.Queue()
+        self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Open a connection to the message database in WAL mode."""
+        conn = sqlite3.connect(
+            self.db_file, check_same_thread=False, isolation_level=None
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _read_legacy_log(self, legacy_file: str) -> Iterator[Tuple]:
+        """Yield message rows from a legacy JSON or JSON-Lines message file."""
+        with open(legacy_file, "rb") as f:
+            if legacy_file.endswith(".jsonl"):
+                for line_number, line in enumerate(f, start=1):
+                    if not line.strip():
+                        continue
+                    try:
+                        record = orjson.loads(line)
+                        yield _legacy_row(record["room"], record)
+                    except (ValueError, KeyError, TypeError):
+                        logger.error(
+                            "Error: Invalid message on line %s of %s",
+                            line_number,
+                            legacy_file,
+                        )
+            else:
+                for room, messages in orjson.loads(f.read()).items():
+                    for record in messages:
+                        try:
+                            yield _legacy_row(room, record)
+                        except (ValueError, KeyError, TypeError):
+                            logger.error(
+                                "Error: Invalid message in room %s of %s",
+                                room,
+                                legacy_file,
+                            )
+
+    def _import_legacy_logs(self, legacy_files: Tuple[str, ...]):
+        """Import messages from legacy message files into an empty database."""
+        if self._conn.execute("SELECT 1 FROM messages LIMIT 1").fetchone():
+            return
+
+        for legacy_file in legacy_files:
+            if not os.path.exists(legacy_file):
+                continue
+            try:
+                rows = list(self._read_legacy_log(legacy_file))
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO messages VALUES (?, ?, ?, ?, ?)", rows
+                )
+                self._conn.execute("COMMIT")
+                logger.info("Imported %s messages from %s", len(rows), legacy_file)
+            except Exception as e:
+                if self._conn.in_transaction:
+                    self._conn.execute("ROLLBACK")
+                logger.error("Error importing messages from %s: %s", legacy_file, e)
 
-    def _load_all_messages(self) -> Dict:
-        """Load all messages from a JSON file."""
-        if os.path.exists(self.message_file):
+    def _cache_room(self, room: str, history: RoomStore):
+        """Insert a room's history into the cache, evicting the least recently used."""
+        self.messages[room] = history
+        self.messages.move_to_end(room)
+        while len(self.messages) > self.max_cached_rooms:
+            self.messages.popitem(last=False)
+
+    def _fetch_history(self, room: str) -> list:
+        """Query the most recent message rows of a room, newest first."""
+        return self._conn.execute(
+            "SELECT name, message, timestamp, id FROM messages"
+            " WHERE room = ? ORDER BY id DESC LIMIT ?",
+            (room, self.history_size),
+        ).fetchall()
+
+    def _room_history(self, room: str) -> RoomStore:
+        """Get a room's cached history, loading it from the database on a miss."""
+        history = self.messages.get(room)
+        if history is not None:
+            self.messages.move_to_end(room)
+            return history
+
+        history = RoomStore(self.history_size)
+        if room in self._nonempty_rooms:
+            self._write_q.join()
+            rows = _run_blocking(self._fetch_history, room)
+            for row in reversed(rows):
+                history.append(*row)
+        self._cache_room(room, history)
+        return history
+
+    def _write_batch(self, rows: list):
+        """Insert a batch of message rows, one at a time if the batch fails."""
+        insert = (
+            "INSERT INTO messages (room, name, message, timestamp, id)"
+            " VALUES (?, ?, ?, ?, ?)"
+        )
+        try:
+            self._write_conn.execute("BEGIN")
+            self._write_conn.executemany(insert, rows)
+            self._write_conn.execute("COMMIT")
+            return
+        except Exception as e:
+            if self._write_conn.in_transaction:
+                self._write_conn.execute("ROLLBACK")
+            logger.error("Error writing messages, retrying individually: %s", e)
+
+        for row in rows:
             try:
-                with open(self.message_file, "r") as f:
-                    return json.load(f)
-            except json.JSONDecodeError:
-                logger.error(f"Error: Invalid JSON format in {self.message_file}")
-                return {}
+                self._write_conn.execute(insert, row)
             except Exception as e:
-                logger.error(f"Error loading messages: {e}")
-                return {}
+                logger.error("Error writing message %s: %s", row, e)
+
+    def _writer_loop(self):
+        """Drain the write queue, inserting each batch off the event loop."""
+        while True:
+            batch = [self._write_q.get()]
+            while len(batch) < WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._write_q.get_nowait())
+                except queue.Empty:
+                    break
 
-        return {}
+            rows = [row for row in batch if row is not None]
+            if rows:
+                _run_blocking(self._write_batch, rows)
+            for _ in batch:
+                self._write_q.task_done()
+            if len(rows) < len(batch):
+                return
 
     def save_message(self, room: str, message: Dict) -> bool:
-        """Save a message to a JSON file."""
+        """Queue a message to be inserted into the database."""
         try:
-            if room not in self.messages:
-                self.messages[room] = []
-
-            message_data = {
-                "name": message["name"],
-                "message": message["message"],
-                "timestamp": datetime.now().isoformat(),
-                "id": len(self.messages[room]),
-            }
-            self.messages[room].append(message_data)
-            with open(self.message_file, "w") as f:
-                json.dump(self.messages, f, indent=4)
+            room = _as_text(room)
+            name = _as_text(message["name"])
+            body = _as_text(message["message"])
+            history = self._room_history(room)
+            message_id = self._next_id[room]
+            timestamp = cached_iso_timestamp()
+            history.append(name, body, timestamp, message_id)
+            self._next_id[room] = message_id + 1
+            self._nonempty_rooms.add(room)
+            self._write_q.put((room, name, body, timestamp, message_id))
             return True
         except Exception as e:
-            logger.error(f"Error saving message: {e}")
+            logger.error("Error saving message: %s", e)
             return False
 
+    def has_history(self, room: str) -> bool:
+        """Check whether any message has ever been saved to a given room."""
+        return _as_text(room) in self._nonempty_rooms
+
     def load_room_messages(self, room: str) -> list:
-        """Load all messages for a given room."""
-        return self.messages.get(room, [])
+        """Load the most recent messages for a given room."""
+        room = _as_text(room)
+        if room not in self._nonempty_rooms:
+            return []
+        return self._room_history(room).to_messages()
+
+    def close(self):
+        """Flush pending writes and close the database connections."""
+        self._write_q.put(None)
+        self._writer.join()
+        self._write_conn.close()
+        self._conn.close()
@@ -1,7 +1,10 @@
 import argparse
+import collections
+import concurrent.futures
 import socketio
 from typing import Optional
 from datetime import datetime
+import random
 import time
 import threading
 import sys
@@ -18,29 +21,52 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+SEND_COALESCE_DELAY = 0.005
+MAX_SEND_BATCH = 64
+
+
 class MessageClient:
-    def __init__(self, server_url: str = "http://localhost:8080"):
+    def __init__(
+        self,
+        server_url: str = "http://localhost:8080",
+        max_retries: int = 5,
+        coalesce_sends: bool = False,
+    ):
         self.sio = socketio.Client(logger=False, engineio_logger=False)
         self.server_url = server_url
+        self.max_retries = max_retries
         self.connected = False
         self.name: Optional[str] = None
         self.room: Optional[str] = None
-        self.input_lock = threading.Lock()
+        self._stdout_lock = threading.Lock()
+        self._render_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.coalesce_sends = coalesce_sends
+        self._send_q: collections.deque = collections.deque()
+        self._send_pending = threading.Event()
+        self._flush_lock = threading.Lock()
+        if coalesce_sends:
+            threading.Thread(target=self._send_loop, daemon=True).start()
         self.setup_socket_handlers()
 
-    def clear_current_line(self):
-        """Clear the current line in terminal"""
-        sys.stdout.write("\r" + " " * 100 + "\r")
-        sys.stdout.flush()
-
     def print_message(self, message: str):
         """Print message with proper formatting"""
-        with self.input_lock:
-            self.clear_current_line()
-            print(message)
-            if self.name:
-                sys.stdout.write(f"{self.name}: ")
-                sys.stdout.flush()
+        name = self.name
+        buf = "\r" + " " * 100 + "\r" + message + "\n"
+        if name:
+            buf += f"{name}: "
+        with self._stdout_lock:
+            sys.stdout.write(buf)
+            sys.stdout.flush()
+
+    def format_message(self, data: dict, default_ts: str) -> str:
+        """Format a chat message for display"""
+        timestamp = data.get("timestamp", default_ts)
+        name = data.get("name", "Unknown")
+        message = data.get("message", "")
+
+        if name == "System":
+            return f"[{timestamp}] {message}"
+        return f"[{timestamp}] {name}: {message}"
 
     def setup_socket_handlers(self):
         """Setup socket handlers."""
@@ -57,57 +83,63 @@ class MessageClient:
         def on_disconnect():
             """Disconnect from the server"""
             self.connected = False
-            self.print_message("\nDisconnected from server")
+            try:
+                self._render_pool.submit(
+                    self.print_message, "\nDisconnected from server"
+                )
+            except RuntimeError:
+                # disconnect() has already shut the render pool down
+                self.print_message("\nDisconnected from server")
 
         @self.sio.on("message")
         def on_message(data):
             """Handle receiving messages from server"""
-            timestamp = data.get("timestamp", datetime.now().strftime("%H:%M:%S"))
-            name = data.get("name", "Unknown")
-            message = data.get("message", "")
-
-            if name == "System":
-                self.print_message(f"[{timestamp}] {message}")
-            else:
-                self.print_message(f"[{timestamp}] {name}: {message}")
+            self._render_pool.submit(
+                self.print_message,
+                self.format_message(data, datetime.now().strftime("%H:%M:%S")),
+            )
 
         @self.sio.on("chat_history")
         def on_chat_history(messages):
             """Handle receiving chat history when joining a room"""
-            for message in messages:
-                timestamp = message.get(
-                    "timestamp", datetime.now().strftime("%H:%M:%S")
+            if not messages:
+                return
+
+            def render():
+                default_ts = datetime.now().strftime("%H:%M:%S")
+                self.print_message(
+                    "\n".join(
+                        self.format_message(message, default_ts)
+                        for message in messages
+                    )
                 )
-                name = message.get("name", "Unknown")
-                message = message.get("message", "")
-                if name == "System":
-                    self.print_message(f"[{timestamp}] {message}")
-                else:
-                    self.print_message(f"[{timestamp}] {name}: {message}")
+
+            self._render_pool.submit(render)
 
         @self.sio.on("error")
         def on_error(data):
             error_msg = data.get("message", "Unknown error occurred")
-            logger.error(f"Server error: {error_msg}")
+            logger.error("Server error: %s", error_msg)
 
     def connect_to_server(self) -> bool:
         """Connect to the server."""
         retry_count = 0
-        max_retries = 3
 
-        while not self.connected and retry_count < max_retries:
+        while not self.connected and retry_count < self.max_retries:
             try:
-                logger.info(f"Connecting to server at {self.server_url}...")
+                logger.info("Connecting to server at %s...", self.server_url)
                 self.sio.connect(self.server_url)
                 return True
             except Exception as e:
                 retry_count += 1
-                if retry_count < max_retries:
-                    logger.error(f"Error connecting to server: {e}. Retrying...")
-                    time.sleep(1)
+                if retry_count < self.max_retries:
+                    logger.error("Error connecting to server: %s. Retrying...", e)
+                    time.sleep(
+                        min(2 ** (retry_count - 1) * 0.1, 2.0) + random.random() * 0.1
+                    )
                 else:
                     logger.error(
-                        f"Error connecting to server: {e}. Max retries exceeded."
+                        "Error connecting to server: %s. Max retries exceeded.", e
                     )
                     return False
 
@@ -118,25 +150,58 @@ class MessageClient:
         try:
             self.room = room
             self.name = name
-            logger.info(f"Joining room {room} as {name}...")
+            logger.info("Joining room %s as %s...", room, name)
             self.sio.emit("join", {"room": room, "name": name})
             return True
         except Exception as e:
-            logger.error(f"Error joining room: {e}")
+            logger.error("Error joining room: %s", e)
             return False
 
+    def _send_loop(self):
+        """Flush queued messages, coalescing those sent within a short delay."""
+        while True:
+            self._send_pending.wait()
+            time.sleep(SEND_COALESCE_DELAY)
+            self._send_pending.clear()
+            self.flush_sends()
+
+    def flush_sends(self) -> bool:
+        """Emit all queued messages, batching them when more than one is queued."""
+        with self._flush_lock:
+            while self._send_q:
+                batch = []
+                while self._send_q and len(batch) < MAX_SEND_BATCH:
+                    batch.append(self._send_q.popleft())
+
+                try:
+                    if len(batch) == 1:
+                        self.sio.emit("message", batch[0])
+                    else:
+                        self.sio.emit("message_batch", batch)
+                except Exception as e:
+                    logger.error("Error sending message: %s", e)
+                    return False
+            return True
+
     def send_message(self, message: str) -> bool:
         """Send a message to the server."""
         if not message.strip():
             return
 
+        if self.coalesce_sends:
+            self._send_q.append(
+                {"room": self.room, "name": self.name, "message": message}
+            )
+            self._send_pending.set()
+            return True
+
         try:
             self.sio.emit(
                 "message", {"room": self.room, "name": self.name, "message": message}
             )
             return True
         except Exception as e:
-            logger.error(f"Error sending message: {e}")
+            logger.error("Error sending message: %s", e)
             return False
 
     def leave_room(self) -> bool:
@@ -146,19 +211,21 @@ class MessageClient:
                 self.sio.emit("leave", {"room": self.room, "name": self.name})
                 return True
             except Exception as e:
-                logger.error(f"Error leaving room: {e}")
+                logger.error("Error leaving room: %s", e)
                 return False
 
     def disconnect(self) -> bool:
         """Disconnect from the server."""
         if self.connected:
             try:
+                self.flush_sends()
                 self.leave_room()
                 self.sio.disconnect()
                 self.connected = False
+                self._render_pool.shutdown(wait=True)
                 return True
             except Exception as e:
-                logger.error(f"Error disconnecting from server: {e}")
+                logger.error("Error disconnecting from server: %s", e)
                 return False
 
 
@@ -168,6 +235,11 @@ def parse_arguments():
     parser.add_argument("--server_url", default="http://localhost:8080")
     parser.add_argument("--name", help="Your name")
     parser.add_argument("--room", help="Room to join")
+    parser.add_argument(
+        "--coalesce",
+        action="store_true",
+        help="Batch messages sent within a few milliseconds of each other",
+    )
 
     return parser.parse_args()
 
@@ -176,7 +248,7 @@ def main():
 
     args = parse_arguments()
 
-    client = MessageClient(server_url=args.server_url)
+    client = MessageClient(server_url=args.server_url, coalesce_sends=args.coalesce)
 
     client.name = args.name or input("Enter your name: ").strip()
     while not client.name:
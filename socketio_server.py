@@ -1,14 +1,48 @@
+import eventlet
+
+eventlet.monkey_patch()
+
 from flask import Flask
 from flask_socketio import SocketIO, emit, join_room, leave_room, send
-from message_server import MessageServer
+from message_server import (
+    MessageServer,
+    acquire_message_dict,
+    cached_iso_timestamp,
+    release_message_dict,
+)
+import atexit
 import logging
-from datetime import datetime
+import operator
+import orjson
 import os
+import sys
 import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+MAX_MESSAGE_BATCH = 64
+
+_get_message_fields = operator.itemgetter("room", "name", "message")
+_get_member_fields = operator.itemgetter("room", "name")
+
+_ROOM_NOT_SPECIFIED = {"message": "Room not specified"}
+_INVALID_MESSAGE = {"message": "Invalid message format"}
+_ROOM_AND_NAME_REQUIRED = {"message": "Room and name are required"}
+
+_SYSTEM_NAME = sys.intern("System")
+_SYSTEM_MESSAGE_TEMPLATE = {"name": _SYSTEM_NAME, "message": "", "timestamp": ""}
+
+
+class _OrjsonShim:
+    """Stdlib-compatible json module backed by orjson, for SocketIO packets."""
+
+    @staticmethod
+    def dumps(obj, *args, **kwargs) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads = staticmethod(orjson.loads)
+
 
 def create_flask_app():
     """Create the Flask application"""
@@ -19,86 +53,108 @@ def create_flask_app():
 
 def create_socketio_app(app: Flask):
     """Create the SocketIO application"""
-    socketio = SocketIO(app)
+    socketio = SocketIO(app, async_mode="eventlet", json=_OrjsonShim)
     message_server = MessageServer()
+    atexit.register(message_server.close)
 
     @socketio.on("message")
     def handle_message(data):
         try:
-            room = data.get("room")
-            if not room:
-                logger.error("No room specified in message")
-                emit("error", {"message": "Room not specified"})
-                return
-            if not data.get("name") or not data.get("message"):
+            try:
+                room, name, message = _get_message_fields(data)
+            except KeyError:
                 logger.error("Invalid message format")
-                emit("error", {"message": "Invalid message format"})
+                emit("error", _INVALID_MESSAGE)
+                return
+            if not (room and name and message):
+                if not room:
+                    logger.error("No room specified in message")
+                    emit("error", _ROOM_NOT_SPECIFIED)
+                else:
+                    logger.error("Invalid message format")
+                    emit("error", _INVALID_MESSAGE)
                 return
-            logger.info(f"Message received in room {room}: {data}")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Message received in room %s: %s", room, data)
             if message_server.save_message(room, data):
                 send(data, to=room)
             else:
                 emit("error", {"message": "Failed to save message"})
         except Exception as e:
-            logger.error(f"Error handling message: {str(e)}")
+            logger.error("Error handling message: %s", e)
             emit("error", {"message": "Internal server error"})
 
+    @socketio.on("message_batch")
+    def handle_message_batch(messages):
+        if (
+            not isinstance(messages, list)
+            or len(messages) > MAX_MESSAGE_BATCH
+            or not all(isinstance(data, dict) for data in messages)
+        ):
+            logger.error("Invalid message batch format")
+            emit("error", _INVALID_MESSAGE)
+            return
+        for data in messages:
+            handle_message(data)
+
     @socketio.on("join")
     def handle_join(data):
         try:
-            room = data.get("room")
-            name = data.get("name")
-
-            if not room or not name:
-                emit("error", {"message": "Room and name are required"})
+            try:
+                room, name = _get_member_fields(data)
+            except KeyError:
+                emit("error", _ROOM_AND_NAME_REQUIRED)
+                return
+            if not (room and name):
+                emit("error", _ROOM_AND_NAME_REQUIRED)
                 return
 
             join_room(room)
 
-            previous_messages = message_server.load_room_messages(room)
-
-            if previous_messages:
-                emit("chat_history", previous_messages)
+            if message_server.has_history(room):
+                emit("chat_history", message_server.load_room_messages(room))
 
-            join_message = {
-                "name": "System",
-                "message": f"{name} joined the room",
-                "timestamp": datetime.now().isoformat(),
-            }
+            join_message = acquire_message_dict()
+            join_message.update(_SYSTEM_MESSAGE_TEMPLATE)
+            join_message["message"] = f"{name} joined the room"
+            join_message["timestamp"] = cached_iso_timestamp()
 
             send(join_message, to=room)
-            logger.info(f"User {name} joined room {room}")
+            release_message_dict(join_message)
+            logger.info("User %s joined room %s", name, room)
 
         except Exception as e:
-            logger.error(f"Error handling join: {str(e)}")
+            logger.error("Error handling join: %s", e)
             emit("error", {"message": "Failed to join room"})
 
     @socketio.on("leave")
     def handle_leave(data):
         try:
-            room = data.get("room")
-            name = data.get("name")
-
-            if not room or not name:
-                emit("error", {"message": "Room and name are required"})
+            try:
+                room, name = _get_member_fields(data)
+            except KeyError:
+                emit("error", _ROOM_AND_NAME_REQUIRED)
+                return
+            if not (room and name):
+                emit("error", _ROOM_AND_NAME_REQUIRED)
                 return
 
             leave_room(room)
-            leave_message = {
-                "name": "System",
-                "message": f"{name} left the room",
-                "timestamp": datetime.now().isoformat(),
-            }
+            leave_message = acquire_message_dict()
+            leave_message.update(_SYSTEM_MESSAGE_TEMPLATE)
+            leave_message["message"] = f"{name} left the room"
+            leave_message["timestamp"] = cached_iso_timestamp()
             send(leave_message, to=room)
-            logger.info(f"User {name} left room {room}")
+            release_message_dict(leave_message)
+            logger.info("User %s left room %s", name, room)
 
         except Exception as e:
-            logger.error(f"Error handling leave: {str(e)}")
+            logger.error("Error handling leave: %s", e)
             emit("error", {"message": "Failed to leave room"})
 
     @socketio.on_error()
     def error_handler(e):
-        logger.error(f"SocketIO error: {str(e)}")
+        logger.error("SocketIO error: %s", e)
         emit("error", {"message": "An error occurred"})
 
     return socketio
@@ -113,5 +169,5 @@ if __name__ == "__main__":
     host = os.environ.get("HOST", "0.0.0.0")
     debug = os.environ.get("DEBUG", "False").lower() == "true"
 
-    logger.info(f"Starting server on {host}:{port} (debug={debug})")
+    logger.info("Starting server on %s:%s (debug=%s)", host, port, debug)
     socketio.run(app, host=host, port=port, debug=debug)